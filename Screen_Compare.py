@@ -2,23 +2,31 @@
 #
 # 1. Tkinter dialogs -> pick Source & Encode.
 # 2. Asks how many random frames to extract (via MediaInfo for total frames & fps).
+#    Frames are stratified across scenes & duration using a cached scene index.
 # 3. Extract ALL screenshots first (fast-seek GPU in ffmpeg).
+#    Failed, black/blank or near-duplicate frames are re-picked before upload.
 # 4. Intelligently crop black bars from top and bottom of Source screenshots.
+#    Optionally (NORMALIZE_RESOLUTION) scale one side to the other's resolution and apply
+#    the Source crop to the Encode, inside the same ffmpeg call that extracts the frame.
+#    Optionally build an amplified difference / SSIM map for each pair (DIFF_MAP_MODE).
 # 5. Then upload all screenshots to and image host (IMG_HOST).
 # 6. Write BBCode lines to:
 #       .\Screens\MovieName (MovieYear)\Comparison_BBCode.txt
 #    The entire document is wrapped in [center]...[/center],
-#    and starts with a line "SOURCE  |  ENCODE".
+#    and starts with a line "SOURCE  |  ENCODE" (plus "|  DIFF" when maps are enabled).
 
 import os
 import re
+import json
+import hashlib
 import random
 import subprocess
 import tkinter as tk
 from tkinter import filedialog, simpledialog
 import requests
 from guessit import guessit
-from PIL import Image  # Import Pillow for image processing
+import numpy as np
+from PIL import Image, ImageOps  # Import Pillow for image processing
 
 ###############################################################################
 # CONFIG
@@ -35,6 +43,31 @@ MEDIAINFO_CMD = "mediainfo"
 CROP_THRESHOLD = 30          # Pixel intensity threshold for considering non-black
 MIN_NON_BLACK_RATIO = 0.05   # Minimum ratio of non-black pixels to consider a row as non-black
 
+# Frame sampling parameters
+SAMPLE_SEED = None           # Set to an int (e.g. 1234) for reproducible frame picks
+SCENE_THRESHOLD = 0.3        # ffmpeg scene-change score (0..1) above which a cut is detected
+SCENE_INDEX_WIDTH = 320      # Width of the low-resolution decode used for scene detection
+SCENE_EDGE_MARGIN = 0.1      # Fraction of each scene to avoid at both ends (fades/cuts)
+SCENE_CACHE_DIRNAME = ".scene_cache"  # Scene indexes are cached here, inside .\Screens
+
+# Frame validation parameters
+MIN_FRAME_MEAN = 16          # Mean luma below this -> frame is considered black
+MAX_FRAME_MEAN = 240         # Mean luma above this -> frame is considered blank/white
+MIN_FRAME_STDDEV = 6         # Luma standard deviation below this -> frame is considered flat
+DUPLICATE_HASH_DISTANCE = 6  # Max differing bits (of 64) for two frames to count as near-duplicates
+MAX_REPICK_ATTEMPTS = 4      # Extraction attempts per frame slot before giving up on it
+
+# Difference map parameters
+DIFF_MAP_MODE = None         # None (off), "absdiff" or "ssim" -> extra DIFF column in the BBCode
+DIFF_AMPLIFY = 4.0           # Multiplier applied to the difference before clipping to 0..255
+DIFF_MAP_BATCH = 8           # Pairs of equal size processed per NumPy batch
+SSIM_WINDOW = 7              # Side of the square window used for local SSIM statistics
+ASPECT_TOLERANCE = 0.01      # Relative aspect-ratio difference still treated as the same framing
+
+# Resolution normalization parameters (applied in the ffmpeg extraction filter graph)
+NORMALIZE_RESOLUTION = None  # None (off), "encode_to_source" or "source_to_encode"
+NORMALIZE_SCALER = "lanczos" # ffmpeg scaler: "lanczos", "spline", "bicubic", "bilinear", ...
+
 ###############################################################################
 # FUNCTIONS
 ###############################################################################
@@ -73,6 +106,24 @@ def get_total_frames_mediainfo(video_path):
     return 0, 0
 
 
+def get_resolution_mediainfo(video_path):
+    """
+    Use MediaInfo to retrieve (width, height).
+    - mediainfo --Inform="Video;%Width%x%Height%" <file>
+    Return (0, 0) if fails.
+    """
+    try:
+        cmd = [MEDIAINFO_CMD, '--Inform=Video;%Width%x%Height%', video_path]
+        res = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        width_str, _, height_str = res.stdout.strip().partition("x")
+        width, height = int(width_str), int(height_str)
+        if width > 0 and height > 0:
+            return width, height
+    except Exception as e:
+        print(f"[ERROR] MediaInfo resolution failed on {video_path}: {e}")
+    return 0, 0
+
+
 def parse_filename_guessit(file_path):
     """
     Parse the Source filename with guessit -> (title, year).
@@ -98,9 +149,31 @@ def seconds_to_hhmmss_ms(sec):
     return f"{h:02}:{m:02}:{s:02}.{ms:03}"
 
 
-def extract_frame_fastseek_gpu(video_path, frame_number, fps, output_path):
+def build_extraction_filter(scale_to=None, crop_result=None, scaler="lanczos"):
+    """
+    Build the -vf filter graph used while extracting a frame, or None if nothing to do.
+    - scale_to:    (width, height) to resize to, using the given ffmpeg scaler
+                   (height -2 keeps the aspect ratio).
+    - crop_result: (crop_box, (width, height)) as returned by intelligently_crop_top_bottom,
+                   in the coordinates of the (scaled) frame; skipped if it keeps the full frame.
     """
-    Use ffmpeg w/ GPU fast-seek:  -hwaccel cuda -ss <timestamp> -frames:v 1 ...
+    filters = []
+    if scale_to:
+        filters.append(f"scale={scale_to[0]}:{scale_to[1]}:flags={scaler}")
+    if crop_result and crop_result[0]:
+        (left, top, right, bottom), size = crop_result
+        right, bottom = min(right, size[0]), min(bottom, size[1])
+        if (left, top, right, bottom) != (0, 0, size[0], size[1]):
+            # exact=1: don't round odd offsets/sizes to the chroma grid, so the Encode
+            # gets exactly the Source's rows
+            filters.append(f"crop={right - left}:{bottom - top}:{left}:{top}:exact=1")
+    return ",".join(filters) if filters else None
+
+
+def extract_frame_fastseek_gpu(video_path, frame_number, fps, output_path, vf=None):
+    """
+    Use ffmpeg w/ GPU fast-seek:  -hwaccel cuda -ss <timestamp> [-vf <filters>] -frames:v 1 ...
+    Return True if ffmpeg succeeded and wrote a non-empty output file.
     """
     timestamp = (frame_number - 1) / fps  # 1-based index
     seek_str = seconds_to_hhmmss_ms(timestamp)
@@ -110,13 +183,238 @@ def extract_frame_fastseek_gpu(video_path, frame_number, fps, output_path):
         '-hwaccel', 'cuda',
         '-ss', seek_str,
         '-i', video_path,
+    ]
+    if vf:
+        cmd += ['-vf', vf]
+    cmd += [
         '-frames:v', '1',
         '-an', '-sn',
         '-loglevel', 'error',
         '-y',
         output_path
     ]
-    subprocess.run(cmd, capture_output=True)
+
+    # ffmpeg can exit 0 without writing anything (e.g. seek past the end), so never
+    # let a screenshot left over from an earlier run pass the existence check below
+    if os.path.isfile(output_path):
+        os.remove(output_path)
+
+    res = subprocess.run(cmd, capture_output=True, text=True, errors="replace")
+    if res.returncode != 0:
+        print(f"     [ERROR] ffmpeg exit code {res.returncode} for frame {frame_number}: {res.stderr.strip()}")
+        return False
+    if not os.path.isfile(output_path) or os.path.getsize(output_path) == 0:
+        print(f"     [ERROR] ffmpeg wrote no image for frame {frame_number} ({os.path.basename(output_path)})")
+        return False
+    return True
+
+
+def frame_stats(image_path):
+    """
+    Compute (mean, stddev, dhash) of the image's luma with NumPy.
+    Mean & stddev are taken over the middle half of the rows so letterbox bars
+    don't drag them down; dhash is a 64-bit difference hash of the whole frame.
+    """
+    with Image.open(image_path) as img:
+        gray = img.convert("L")
+        small = gray.resize((9, 8), Image.BILINEAR)
+        luma = np.asarray(gray, dtype=np.float32)
+
+    height = luma.shape[0]
+    band = luma[height // 4: height - height // 4] if height >= 4 else luma
+    mean = float(band.mean())
+    std = float(band.std())
+
+    px = np.asarray(small, dtype=np.int16)
+    bits = (px[:, 1:] > px[:, :-1]).ravel()
+    dhash = int.from_bytes(np.packbits(bits).tobytes(), "big")
+    return mean, std, dhash
+
+
+def hash_distances(dhash, known_hashes):
+    """
+    Hamming distances between one 64-bit hash and a list of known hashes (vectorized).
+    """
+    if not known_hashes:
+        return np.empty(0, dtype=np.int64)
+    known = np.array(known_hashes, dtype=np.uint64)
+    xor = np.bitwise_xor(known, np.uint64(dhash))
+    return np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+def check_frame_usable(image_path, known_hashes):
+    """
+    Validate an extracted screenshot before it gets cropped & uploaded.
+    Return (problem, dhash); problem is None if the frame is usable, otherwise a short reason.
+    """
+    try:
+        mean, std, dhash = frame_stats(image_path)
+    except Exception as e:
+        return f"unreadable image ({e})", None
+
+    if mean < MIN_FRAME_MEAN:
+        return f"black frame (mean={mean:.1f})", dhash
+    if mean > MAX_FRAME_MEAN:
+        return f"blank frame (mean={mean:.1f})", dhash
+    if std < MIN_FRAME_STDDEV:
+        return f"flat frame (stddev={std:.1f})", dhash
+
+    distances = hash_distances(dhash, known_hashes)
+    if distances.size and distances.min() <= DUPLICATE_HASH_DISTANCE:
+        return f"near-duplicate of an earlier frame (hash distance={int(distances.min())})", dhash
+    return None, dhash
+
+
+def build_scene_index(video_path, threshold=0.3, width=320):
+    """
+    Detect scene cuts in one low-resolution decode pass:
+      ffmpeg -i <file> -vf "scale=<width>:-2,select='gt(scene,<threshold>)',showinfo" -f null -
+    Return a sorted list of cut timestamps in seconds, or None if ffmpeg fails.
+    """
+    vf = f"scale={width}:-2,select='gt(scene,{threshold})',showinfo"
+    cmd = [
+        FFMPEG_CMD,
+        '-hwaccel', 'cuda',
+        '-i', video_path,
+        '-map', '0:v:0',
+        '-vf', vf,
+        '-an', '-sn',
+        '-nostats',
+        '-loglevel', 'info',
+        '-f', 'null',
+        '-'
+    ]
+    try:
+        res = subprocess.run(cmd, capture_output=True, text=True, errors="replace")
+    except Exception as e:
+        print(f"[ERROR] Scene detection failed on {video_path}: {e}")
+        return None
+    if res.returncode != 0:
+        print(f"[ERROR] Scene detection failed on {video_path} (ffmpeg exit code {res.returncode}).")
+        return None
+
+    # showinfo writes one line per selected frame to stderr, e.g. "... pts_time:83.458 ..."
+    cuts = [float(t) for t in re.findall(r"pts_time:\s*([0-9.]+)", res.stderr)]
+    return sorted(set(cuts))
+
+
+def load_scene_index(video_path, cache_dir, threshold=0.3, width=320):
+    """
+    Return the scene cut timestamps for video_path, using a per-file JSON cache.
+    The cache key covers the file's path, size & mtime plus the detection settings,
+    so a replaced file or changed threshold triggers a fresh scan.
+    Return [] if no index could be built (sampling then falls back to duration only).
+    """
+    abs_path = os.path.abspath(video_path)
+    try:
+        st = os.stat(abs_path)
+    except OSError as e:
+        print(f"[ERROR] Cannot stat {video_path}: {e}")
+        return []
+
+    key_src = f"{abs_path}|{st.st_size}|{int(st.st_mtime)}|{threshold}|{width}"
+    key = hashlib.sha1(key_src.encode("utf-8")).hexdigest()
+    cache_path = os.path.join(cache_dir, f"{key}.json")
+
+    if os.path.isfile(cache_path):
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                cuts = json.load(f)["cuts"]
+            print(f"[INFO] Loaded cached scene index ({len(cuts)} cuts) for {os.path.basename(video_path)}")
+            return cuts
+        except Exception as e:
+            print(f"[WARN] Ignoring unreadable scene cache {cache_path}: {e}")
+
+    print(f"[INFO] Building scene index for {os.path.basename(video_path)} (one low-res pass)...")
+    cuts = build_scene_index(video_path, threshold=threshold, width=width)
+    if cuts is None:
+        return []
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(cache_path, "w", encoding="utf-8") as f:
+            json.dump({"video": abs_path, "cuts": cuts}, f)
+        print(f"[INFO] Scene index built: {len(cuts)} cuts (cached).")
+    except Exception as e:
+        print(f"[WARN] Scene index built: {len(cuts)} cuts, but caching failed: {e}")
+    return cuts
+
+
+def scene_starts_from_cuts(cuts, fps, total_frames):
+    """
+    Convert cut timestamps (seconds) -> sorted 1-based scene start frames in 1..total_frames.
+    The first scene always starts at frame 1.
+    """
+    starts = {1}
+    for t in cuts:
+        frame = int(round(t * fps)) + 1
+        if 1 < frame <= total_frames:
+            starts.add(frame)
+    return sorted(starts)
+
+
+def stratify_frame_range(total_frames, count):
+    """
+    Split 1..total_frames into `count` contiguous, equal-duration strata.
+    Return a list of inclusive (lo, hi) frame ranges; requires count <= total_frames.
+    """
+    return [
+        (1 + i * total_frames // count, (i + 1) * total_frames // count)
+        for i in range(count)
+    ]
+
+
+def pick_frame_in_stratum(scene_starts, lo, hi, rng, used_scenes, exclude=()):
+    """
+    Pick one frame inside the stratum lo..hi (inclusive).
+    Scenes overlapping the stratum are weighted by their overlap length; scenes already
+    used by other strata are avoided when possible. Inside the chosen scene, frames
+    close to the cuts are avoided (SCENE_EDGE_MARGIN).
+    Return (frame, scene_index), or (None, None) if every frame is excluded.
+    """
+    segments = []  # (scene_index, seg_lo, seg_hi)
+    for idx, start in enumerate(scene_starts):
+        end = scene_starts[idx + 1] - 1 if idx + 1 < len(scene_starts) else hi
+        seg_lo, seg_hi = max(start, lo), min(end, hi)
+        if seg_lo <= seg_hi:
+            segments.append((idx, seg_lo, seg_hi))
+
+    fresh = [seg for seg in segments if seg[0] not in used_scenes]
+    for pool in (fresh, segments):
+        pool = list(pool)
+        while pool:
+            weights = [seg_hi - seg_lo + 1 for _, seg_lo, seg_hi in pool]
+            seg = rng.choices(pool, weights=weights)[0]
+            scene_idx, seg_lo, seg_hi = seg
+
+            margin = int((seg_hi - seg_lo) * SCENE_EDGE_MARGIN)
+            for a, b in ((seg_lo + margin, seg_hi - margin), (seg_lo, seg_hi)):
+                taken = sum(1 for f in exclude if a <= f <= b)
+                if b - a + 1 > taken:
+                    frame = rng.randint(a, b)
+                    while frame in exclude:
+                        frame = rng.randint(a, b)
+                    return frame, scene_idx
+            pool.remove(seg)
+    return None, None
+
+
+def pick_frames_stratified(scene_starts, total_frames, count, rng, used_scenes=None):
+    """
+    Pick `count` frames from 1..total_frames, one per equal-duration stratum,
+    spreading the picks over as many different scenes as possible.
+    Pass a set as used_scenes to collect the scenes picked (for later re-picks).
+    Return (frames, strata); frames[i] lies inside strata[i].
+    """
+    strata = stratify_frame_range(total_frames, count)
+    if used_scenes is None:
+        used_scenes = set()
+    frames = []
+    for lo, hi in strata:
+        frame, scene_idx = pick_frame_in_stratum(scene_starts, lo, hi, rng, used_scenes)
+        used_scenes.add(scene_idx)
+        frames.append(frame)
+    return frames, strata
 
 
 def intelligently_crop_top_bottom(image_path, output_path, threshold=30, min_ratio=0.05):
@@ -126,6 +424,8 @@ def intelligently_crop_top_bottom(image_path, output_path, threshold=30, min_rat
     Parameters:
         - threshold: Pixel intensity above which a pixel is considered non-black.
         - min_ratio: Minimum ratio of non-black pixels in a row to consider it as content.
+    Return (crop_box, (width, height)): the box kept, in the original image's coordinates,
+    and the original size. Return (None, None) if cropping failed.
     """
     try:
         with Image.open(image_path) as img:
@@ -163,17 +463,162 @@ def intelligently_crop_top_bottom(image_path, output_path, threshold=30, min_rat
             if cropped_height / height < 0.3:
                 print(f"     [WARN] Cropped height {cropped_height} is less than 30% of original height. Skipping cropping.")
                 img.save(output_path)
+                crop_box = (0, 0, width, height)
             else:
                 # Crop and save
                 cropped_img = img.crop(crop_box)
                 cropped_img.save(output_path)
                 print(f"     [INFO] Image cropped: {crop_box}")
 
+            return crop_box, (width, height)
+
     except Exception as e:
         print(f"[ERROR] Cropping failed for {image_path}: {e}")
         # In case of error, save the original image
         with Image.open(image_path) as img:
             img.save(output_path)
+        return None, None
+
+
+def same_aspect(size_a, size_b, tolerance=ASPECT_TOLERANCE):
+    """
+    True if two (width, height) sizes have the same aspect ratio, within a relative tolerance.
+    """
+    aspect_a = size_a[0] / size_a[1]
+    aspect_b = size_b[0] / size_b[1]
+    return abs(aspect_a - aspect_b) <= tolerance * aspect_b
+
+
+def load_pair_luma(source_path, encode_path, crop_box, source_size, encode_cropped=False):
+    """
+    Load a (cropped Source, Encode) screenshot pair as float32 luma arrays of equal shape.
+    The Source file is already cropped. If the Encode has the uncropped Source's framing,
+    the Source crop_box (scaled uniformly to the Encode's resolution) is applied to it;
+    if it already has the cropped Source's framing it is used as is. Only then is the
+    Encode resized to the Source's size.
+    encode_cropped: the Encode was already cropped in the ffmpeg filter graph.
+    Return None (with a warning) if the pair can't be aligned.
+    """
+    with Image.open(source_path) as img:
+        src = img.convert("L")
+    with Image.open(encode_path) as img:
+        enc = img.convert("L")
+
+    name = os.path.basename(encode_path)
+    if enc.size == src.size:
+        return np.asarray(src, dtype=np.float32), np.asarray(enc, dtype=np.float32)
+
+    if encode_cropped:
+        print(f"   [WARN] {name} is {enc.width}x{enc.height} but the cropped Source is "
+              f"{src.width}x{src.height}. Skipping its difference map.")
+        return None
+
+    if crop_box and source_size and same_aspect(enc.size, source_size):
+        scale = enc.width / source_size[0]
+        left, top, right, bottom = crop_box
+        enc = enc.crop((round(left * scale), round(top * scale), round(right * scale), round(bottom * scale)))
+    elif not same_aspect(enc.size, src.size):
+        print(f"   [WARN] {name} ({enc.width}x{enc.height}) has a different framing than the Source "
+              f"({src.width}x{src.height} cropped). Skipping its difference map.")
+        return None
+
+    if enc.size != src.size:
+        enc = enc.resize(src.size, Image.BICUBIC)
+
+    return np.asarray(src, dtype=np.float32), np.asarray(enc, dtype=np.float32)
+
+
+def box_mean(x, size):
+    """
+    Mean over a size x size window for a batch of images (N, H, W), via integral images.
+    The output is edge-padded back to (N, H, W).
+    """
+    n, h, w = x.shape
+    size = max(1, min(size, h, w))
+    integral = np.zeros((n, h + 1, w + 1), dtype=np.float64)
+    np.cumsum(np.cumsum(x, axis=1, dtype=np.float64), axis=2, out=integral[:, 1:, 1:])
+    sums = (integral[:, size:, size:] - integral[:, :-size, size:]
+            - integral[:, size:, :-size] + integral[:, :-size, :-size])
+    means = (sums / (size * size)).astype(np.float32)
+    pad_top, pad_left = (size - 1) // 2, (size - 1) // 2
+    return np.pad(means, ((0, 0), (pad_top, size - 1 - pad_top), (pad_left, size - 1 - pad_left)), mode="edge")
+
+
+def diff_maps_batch(src, enc, mode, amplify):
+    """
+    Compute difference maps & scores for a batch of equal-size luma pairs (N, H, W).
+    - "absdiff": map = |src - enc| * amplify, scores = mean absolute error & PSNR.
+    - "ssim":    map = (1 - SSIM) * 255 * amplify, score = mean SSIM.
+    Return (maps as uint8 (N, H, W), list of score dicts).
+    """
+    if mode == "ssim":
+        c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+        mu_s = box_mean(src, SSIM_WINDOW)
+        mu_e = box_mean(enc, SSIM_WINDOW)
+        var_s = box_mean(src * src, SSIM_WINDOW) - mu_s * mu_s
+        var_e = box_mean(enc * enc, SSIM_WINDOW) - mu_e * mu_e
+        cov = box_mean(src * enc, SSIM_WINDOW) - mu_s * mu_e
+        ssim = ((2 * mu_s * mu_e + c1) * (2 * cov + c2)) / ((mu_s ** 2 + mu_e ** 2 + c1) * (var_s + var_e + c2))
+        maps = np.clip((1.0 - ssim) * 255.0 * amplify, 0, 255).astype(np.uint8)
+        scores = [{"SSIM": float(v)} for v in ssim.mean(axis=(1, 2))]
+        return maps, scores
+
+    diff = np.abs(src - enc)
+    maps = np.clip(diff * amplify, 0, 255).astype(np.uint8)
+    mae = diff.mean(axis=(1, 2))
+    mse = (diff * diff).mean(axis=(1, 2))
+    psnr = np.where(mse > 0, 10.0 * np.log10((255.0 ** 2) / np.maximum(mse, 1e-12)), np.inf)
+    scores = [{"MAE": float(a), "PSNR": float(p)} for a, p in zip(mae, psnr)]
+    return maps, scores
+
+
+def compute_diff_maps(pairs, mode="absdiff", amplify=4.0, batch_size=8):
+    """
+    Compute difference maps for a list of (src, enc) luma array pairs.
+    Pairs with the same shape are stacked and processed together in batches.
+    Return (maps, scores) in the same order as pairs.
+    """
+    maps = [None] * len(pairs)
+    scores = [None] * len(pairs)
+
+    by_shape = {}
+    for i, (src, _) in enumerate(pairs):
+        by_shape.setdefault(src.shape, []).append(i)
+
+    for indices in by_shape.values():
+        for start in range(0, len(indices), batch_size):
+            chunk = indices[start:start + batch_size]
+            src = np.stack([pairs[i][0] for i in chunk])
+            enc = np.stack([pairs[i][1] for i in chunk])
+            batch_maps, batch_scores = diff_maps_batch(src, enc, mode, amplify)
+            for j, i in enumerate(chunk):
+                maps[i] = batch_maps[j]
+                scores[i] = batch_scores[j]
+    return maps, scores
+
+
+def save_diff_map(diff_map, output_path):
+    """
+    Save a uint8 difference map as a black -> red -> yellow heatmap PNG.
+    """
+    gray = Image.fromarray(diff_map)
+    heat = ImageOps.colorize(gray, black="black", white="yellow", mid="red")
+    heat.save(output_path)
+
+
+def format_scores(scores):
+    """
+    Format a score dict -> "SSIM=0.9812" / "MAE=1.23  PSNR=42.10 dB"
+    """
+    parts = []
+    for name, value in scores.items():
+        if name == "PSNR":
+            parts.append(f"PSNR={value:.2f} dB")
+        elif name == "SSIM":
+            parts.append(f"SSIM={value:.4f}")
+        else:
+            parts.append(f"{name}={value:.2f}")
+    return "  ".join(parts)
 
 
 def upload_to_img_host(image_path, api_key):
@@ -262,17 +707,49 @@ def main():
     print(f"Source -> total_frames={s_total}, fps={s_fps}")
     print(f"Encode -> total_frames={e_total}, fps={e_fps}\n")
 
+    diff_mode = DIFF_MAP_MODE
+    if diff_mode not in (None, "absdiff", "ssim"):
+        print(f"[WARN] Unknown DIFF_MAP_MODE '{diff_mode}'. Difference maps disabled.\n")
+        diff_mode = None
+
+    # Resolution normalization: decide which side (if any) gets scaled during extraction
+    src_scale = enc_scale = None
+    crop_encode = False
+    normalize = NORMALIZE_RESOLUTION
+    if normalize not in (None, "encode_to_source", "source_to_encode"):
+        print(f"[WARN] Unknown NORMALIZE_RESOLUTION '{normalize}'. Resolution normalization disabled.\n")
+        normalize = None
+    if normalize:
+        s_res = get_resolution_mediainfo(source_file)
+        e_res = get_resolution_mediainfo(encode_file)
+        if not all(s_res) or not all(e_res):
+            print("[WARN] Could not read resolutions. Resolution normalization disabled.\n")
+            normalize = None
+        else:
+            print(f"Source -> {s_res[0]}x{s_res[1]}")
+            print(f"Encode -> {e_res[0]}x{e_res[1]}")
+            # Scale by the width ratio; the exact size is only used when both sides share
+            # the same framing (an already-cropped Encode would otherwise be stretched)
+            crop_encode = same_aspect(e_res, s_res)
+            if s_res != e_res and normalize == "encode_to_source":
+                enc_scale = s_res if crop_encode else (s_res[0], -2)
+            elif s_res != e_res and normalize == "source_to_encode":
+                src_scale = e_res if crop_encode else (e_res[0], -2)
+
+            if crop_encode:
+                print(f"[INFO] Normalizing resolution ({normalize}, {NORMALIZE_SCALER}); "
+                      f"Source crop will be applied to the Encode.\n")
+            else:
+                print(f"[WARN] Encode framing differs from the Source (already cropped?). Normalizing "
+                      f"resolution ({normalize}, {NORMALIZE_SCALER}) by width only; "
+                      f"Source crop will NOT be applied to the Encode.\n")
+
     # 5) If frames_count > min, clamp it
     min_total = min(s_total, e_total)
     if frames_count > min_total:
         frames_count = min_total
         print(f"[WARN] Requested frames exceed available. Limiting to {min_total}.\n")
 
-    # Pick random frames
-    chosen_frames = random.sample(range(1, min_total + 1), frames_count)
-    chosen_frames.sort()
-    print(f"[INFO] Chosen frames: {chosen_frames}\n")
-
     # 6) Determine subfolder: .\Screens\MovieName (MovieYear)
     g_title, g_year = parse_filename_guessit(source_file)
     if g_title:
@@ -292,41 +769,123 @@ def main():
 
     print(f"[INFO] Screens & BBCode will be stored in:\n  {out_dir}\n")
 
-    # 7) Extract all screenshots first
+    # Pick frames stratified across scenes & duration (scene index cached per Source file)
+    cache_dir = os.path.join(screens_dir, SCENE_CACHE_DIRNAME)
+    cuts = load_scene_index(source_file, cache_dir, threshold=SCENE_THRESHOLD, width=SCENE_INDEX_WIDTH)
+    scene_starts = scene_starts_from_cuts(cuts, s_fps, min_total)
+
+    rng = random.Random(SAMPLE_SEED)
+    if SAMPLE_SEED is not None:
+        print(f"[INFO] Using sample seed {SAMPLE_SEED}.")
+    used_scenes = set()
+    chosen_frames, strata = pick_frames_stratified(scene_starts, min_total, frames_count, rng, used_scenes)
+    print(f"[INFO] Chosen frames ({len(scene_starts)} scenes): {chosen_frames}\n")
+
+    # 7) Extract all screenshots first, validating each pair & re-picking bad frames.
+    #    Black bars are cropped from the Source (top & bottom only) right after extraction,
+    #    so that with normalization the Encode is scaled & cropped to match in a single ffmpeg call.
     print(f"[INFO] Extracting {frames_count} frames for both files (fast-seek GPU)...")
     source_screens = []
     encode_screens = []
-
-    for idx, frame_num in enumerate(chosen_frames, start=1):
-        print(f"   -> Extracting frame {frame_num} ({idx}/{frames_count})")
-
-        # Source
-        src_out = os.path.join(out_dir, f"Source_frame{frame_num}.png")
-        extract_frame_fastseek_gpu(source_file, frame_num, s_fps, src_out)
-        print(f"     Extracted Source frame {frame_num} to {os.path.basename(src_out)}")
-
-        # Encode
-        enc_out = os.path.join(out_dir, f"Encode_frame{frame_num}.png")
-        extract_frame_fastseek_gpu(encode_file, frame_num, e_fps, enc_out)
-        print(f"     Extracted Encode frame {frame_num} to {os.path.basename(enc_out)}")
-
-        source_screens.append(src_out)
-        encode_screens.append(enc_out)
-
-    print("[INFO] Extraction complete.\n")
-
-    # 8) Intelligently crop black bars from Source screenshots only (top & bottom)
-    print("[INFO] Cropping black bars from Source screenshots (top & bottom only)...\n")
-    for img_path in source_screens:
-        print(f"   -> Cropping {os.path.basename(img_path)}")
-        intelligently_crop_top_bottom(img_path, img_path, threshold=CROP_THRESHOLD, min_ratio=MIN_NON_BLACK_RATIO)
-
-    print("[INFO] Cropping complete.\n")
+    crop_results = []
+    accepted_frames = []
+    known_hashes = []
+    src_vf = build_extraction_filter(scale_to=src_scale, scaler=NORMALIZE_SCALER)
+
+    for idx, (frame_num, (lo, hi)) in enumerate(zip(chosen_frames, strata), start=1):
+        tried = set()
+        for attempt in range(1, MAX_REPICK_ATTEMPTS + 1):
+            print(f"   -> Extracting frame {frame_num} ({idx}/{frames_count})")
+
+            # Source
+            src_out = os.path.join(out_dir, f"Source_frame{frame_num}.png")
+            enc_out = os.path.join(out_dir, f"Encode_frame{frame_num}.png")
+            if not extract_frame_fastseek_gpu(source_file, frame_num, s_fps, src_out, vf=src_vf):
+                problem = "Source extraction failed"
+            else:
+                problem, dhash = check_frame_usable(src_out, known_hashes)
+
+            if problem is None:
+                crop_result = intelligently_crop_top_bottom(
+                    src_out, src_out, threshold=CROP_THRESHOLD, min_ratio=MIN_NON_BLACK_RATIO
+                )
+
+                # Encode
+                enc_vf = build_extraction_filter(
+                    scale_to=enc_scale, crop_result=crop_result if crop_encode else None, scaler=NORMALIZE_SCALER
+                )
+                if not extract_frame_fastseek_gpu(encode_file, frame_num, e_fps, enc_out, vf=enc_vf):
+                    problem = "Encode extraction failed"
+                else:
+                    # Same black/blank/flat checks as the Source (no duplicate check)
+                    enc_problem, _ = check_frame_usable(enc_out, [])
+                    if enc_problem:
+                        problem = f"Encode {enc_problem}"
+
+            if problem is None:
+                print(f"     Extracted Source frame {frame_num} to {os.path.basename(src_out)}")
+                print(f"     Extracted Encode frame {frame_num} to {os.path.basename(enc_out)}")
+                source_screens.append(src_out)
+                encode_screens.append(enc_out)
+                crop_results.append(crop_result)
+                accepted_frames.append(frame_num)
+                known_hashes.append(dhash)
+                break
+
+            print(f"     [WARN] Frame {frame_num} rejected: {problem}")
+            for path in (src_out, enc_out):
+                if os.path.isfile(path):
+                    os.remove(path)
+            tried.add(frame_num)
+            if attempt == MAX_REPICK_ATTEMPTS:
+                print(f"     [WARN] No usable frame found for slot {idx} after {attempt} attempts. Skipping it.")
+                break
+
+            # Re-pick inside the same stratum so the spread across the film is kept
+            frame_num, scene_idx = pick_frame_in_stratum(scene_starts, lo, hi, rng, used_scenes, exclude=tried)
+            if frame_num is None:
+                print(f"     [WARN] No frames left to try for slot {idx}. Skipping it.")
+                break
+            used_scenes.add(scene_idx)
+            print(f"     [INFO] Re-picked frame {frame_num} (attempt {attempt + 1}/{MAX_REPICK_ATTEMPTS})")
+
+    if not source_screens:
+        print("[ERROR] No usable frames could be extracted. Exiting.")
+        return
+    if len(source_screens) < frames_count:
+        print(f"[WARN] Only {len(source_screens)} of {frames_count} frames are usable.")
+    frames_count = len(source_screens)
+    print(f"[INFO] Extraction & cropping complete. Frames: {accepted_frames}\n")
+
+    # 8) Optional: difference maps, with the Source crop applied to both sides
+    diff_screens = []
+    if diff_mode:
+        print(f"[INFO] Building '{diff_mode}' difference maps...\n")
+        pairs = [
+            load_pair_luma(source_screens[i], encode_screens[i], *crop_results[i], encode_cropped=crop_encode)
+            for i in range(frames_count)
+        ]
+        aligned = [i for i, pair in enumerate(pairs) if pair is not None]
+        diff_maps, diff_scores = compute_diff_maps(
+            [pairs[i] for i in aligned], mode=diff_mode, amplify=DIFF_AMPLIFY, batch_size=DIFF_MAP_BATCH
+        )
+        del pairs
+
+        diff_screens = [None] * frames_count
+        for j, i in enumerate(aligned):
+            frame_num = accepted_frames[i]
+            diff_out = os.path.join(out_dir, f"Diff_frame{frame_num}.png")
+            save_diff_map(diff_maps[j], diff_out)
+            diff_screens[i] = diff_out
+            print(f"   -> Frame {frame_num}: {format_scores(diff_scores[j])}")
+
+        print("[INFO] Difference maps complete.\n")
 
     # 9) Now upload them all
     print("[INFO] Uploading all extracted images to your image host...\n")
     src_urls = []
     enc_urls = []
+    diff_urls = []
 
     for i in range(frames_count):
         print(f"   -> Uploading pair {i+1}/{frames_count} ...")
@@ -336,6 +895,12 @@ def main():
         src_urls.append(src_url)
         enc_urls.append(enc_url)
 
+        if diff_screens:
+            diff_url = None
+            if diff_screens[i]:
+                diff_url = upload_to_img_host(diff_screens[i], IMG_HOST_API_KEY) or "UPLOAD_FAILED"
+            diff_urls.append(diff_url)
+
     # 10) Write out the BBCode file in the same subfolder, with heading & center wrapper
     bbcode_path = os.path.join(out_dir, "Comparison_BBCode.txt")
     print(f"\n[INFO] Writing BBCode lines to {bbcode_path}...\n")
@@ -343,7 +908,7 @@ def main():
     with open(bbcode_path, "w", encoding="utf-8") as f:
         # Start with [center] and heading
         f.write("[center]\n")
-        f.write("SOURCE  |  ENCODE\n\n")
+        f.write("SOURCE  |  ENCODE  |  DIFF\n\n" if any(diff_urls) else "SOURCE  |  ENCODE\n\n")
 
         # Then each line of BBCode
         for i in range(frames_count):
@@ -351,6 +916,8 @@ def main():
                 f"[url={src_urls[i]}][img=300]{src_urls[i]}[/img][/url]    "
                 f"[url={enc_urls[i]}][img=300]{enc_urls[i]}[/img][/url]"
             )
+            if diff_urls and diff_urls[i]:
+                line += f"    [url={diff_urls[i]}][img=300]{diff_urls[i]}[/img][/url]"
             f.write(line + "\n")
 
         # End center block